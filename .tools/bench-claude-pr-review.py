@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.8"
+# dependencies = []
+# ///
+"""Offline benchmark for claude-pr-review.py.
+
+Builds a synthetic origin repository with N pull requests, puts fake `gh` and
+`claude` executables first on PATH and times the review script end to end in
+several scenarios. Nothing touches the network, so it runs on any Linux box
+with git and Python.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REVIEW_SCRIPT = Path(__file__).resolve().parent / "claude-pr-review.py"
+
+# Answers the gh calls claude-pr-review.py makes from canned JSON ($FAKE_GH_DATA).
+FAKE_GH = r"""
+import json, os, re, subprocess, sys
+
+args = sys.argv[1:]
+with open(os.environ["FAKE_GH_DATA"]) as f:
+    prs = json.load(f)
+
+
+def info(number):
+    if number not in prs:
+        sys.exit(f"GraphQL: Could not resolve to a PullRequest with the number of {number}.")
+    return prs[number]
+
+
+if args[:2] == ["pr", "view"]:
+    print(json.dumps(info(args[2])))
+elif args[:2] == ["pr", "list"]:
+    print(json.dumps(list(prs.values())))
+elif args[:2] == ["pr", "diff"]:
+    pr = info(args[2])
+    sys.stdout.write(subprocess.run(
+        ["git", "--git-dir", os.environ["FAKE_GH_ORIGIN"], "diff",
+         f"{pr['baseRefName']}...{pr['headRefOid']}"],
+        capture_output=True, text=True, check=True,
+    ).stdout)
+elif args[:2] == ["api", "graphql"]:
+    query = args[args.index("-f") + 1].partition("=")[2]
+    repository = {}
+    for number in re.findall(r"pr(\d+): pullRequest", query):
+        repository[f"pr{number}"] = info(number)
+    print(json.dumps({"data": {"repository": repository}}))
+else:
+    sys.exit(f"fake gh: unsupported command: {' '.join(args)}")
+"""
+
+# Streams a few lines, sleeps $FAKE_CLAUDE_SLEEP seconds and writes the report.
+FAKE_CLAUDE = r"""
+import os, re, sys, time
+
+prompt = sys.argv[sys.argv.index("-p") + 1]
+report = re.findall(r"Write the report to (\S+?)\.?$", prompt, re.M)[-1]
+delay = float(os.environ.get("FAKE_CLAUDE_SLEEP", "0"))
+for step in range(3):
+    print(f"fake claude: step {step}", flush=True)
+    time.sleep(delay / 3)
+with open(report, "w") as f:
+    f.write(f"# Review\n\nPrompt was {len(prompt)} bytes.\n")
+"""
+
+
+def git(*args, cwd=None, env=None):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, env=env, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def dir_size(path):
+    """Return the apparent size in bytes of every regular file under path."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            full = os.path.join(root, name)
+            if not os.path.islink(full):
+                total += os.path.getsize(full)
+    return total
+
+
+def random_text(rng, size):
+    words = ["alpha", "beta", "gamma", "delta", "func", "return", "if", "err", "nil"]
+    lines, length = [], 0
+    while length < size:
+        line = " ".join(rng.choice(words) for _ in range(8))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def write_executable(path, body):
+    path.write_text(f"#!{sys.executable}\n{body}")
+    path.chmod(0o755)
+
+
+def build_fixture(root, args, env):
+    """Create origin.git with args.prs pull requests and a clone to review from."""
+    rng = random.Random(args.seed)
+    origin = root / "origin.git"
+    seed_dir = root / "seed"
+    repo = root / "repo"
+    git("init", "--quiet", "--bare", "--initial-branch=main", str(origin), env=env)
+    git("init", "--quiet", "--initial-branch=main", str(seed_dir), env=env)
+
+    for i in range(args.base_files):
+        path = seed_dir / f"pkg{i % 10}" / f"file{i}.go"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(random_text(rng, args.base_file_kb * 1024))
+    (seed_dir / "CLAUDE.md").write_text("# Guidelines\n")
+    git("add", "-A", cwd=seed_dir, env=env)
+    git("commit", "--quiet", "-m", "base", cwd=seed_dir, env=env)
+
+    prs = {}
+    per_file = max(1, args.diff_kb * 1024 // args.files_per_pr)
+    for n in range(1, args.prs + 1):
+        git("checkout", "--quiet", "-B", f"pr-{n}", "main", cwd=seed_dir, env=env)
+        for j in range(args.files_per_pr):
+            rel = f"pkg{(n + j) % 10}/pr{n}_{j}.go"
+            (seed_dir / rel).write_text(random_text(rng, per_file))
+        git("add", "-A", cwd=seed_dir, env=env)
+        git("commit", "--quiet", "-m", f"PR {n}", cwd=seed_dir, env=env)
+        prs[str(n)] = {
+            "number": n,
+            "title": f"Synthetic PR {n}",
+            "headRefName": f"pr-{n}",
+            "headRefOid": git("rev-parse", "HEAD", cwd=seed_dir, env=env),
+            "baseRefName": "main",
+        }
+
+    git("push", "--quiet", str(origin), "main", cwd=seed_dir, env=env)
+    # GitHub serves every PR head as refs/pull/<n>/head.
+    refspecs = [f"pr-{n}:refs/heads/pr-{n}" for n in prs]
+    refspecs += [f"pr-{n}:refs/pull/{n}/head" for n in prs]
+    git("push", "--quiet", str(origin), *refspecs, cwd=seed_dir, env=env)
+    git("clone", "--quiet", str(origin), str(repo), env=env)
+    (repo / ".git" / "info" / "exclude").write_text("temp/\n")
+
+    data = root / "prs.json"
+    data.write_text(json.dumps(prs))
+    return repo, origin, data
+
+
+def reset_state(repo, env):
+    """Drop worktrees and every cache so the next scenario starts cold."""
+    for line in git("worktree", "list", "--porcelain", cwd=repo, env=env).splitlines():
+        if line.startswith("worktree ") and Path(line[9:]) != repo:
+            git("worktree", "remove", "--force", line[9:], cwd=repo, env=env)
+    shutil.rmtree(repo / "temp", ignore_errors=True)
+    git("worktree", "prune", cwd=repo, env=env)
+
+
+def run_review(repo, root, env, pr_numbers, extra_args, label):
+    """Run the review script once; return wall time and its run report summary."""
+    report = root / f"report-{label}.jsonl"
+    cmd = [
+        sys.executable,
+        str(REVIEW_SCRIPT),
+        *pr_numbers,
+        "--output-dir",
+        str(root / "out"),
+        "--report",
+        str(report),
+        *extra_args,
+    ]
+    began = time.perf_counter()
+    result = subprocess.run(cmd, cwd=repo, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - began
+    if result.returncode != 0:
+        sys.exit(f"{label}: review script failed\n{result.stdout}\n{result.stderr}")
+    summary = json.loads(report.read_text().splitlines()[-1])
+    return wall, summary
+
+
+SCENARIOS = {
+    # name: (use every PR?, extra arguments, warm-up run first?)
+    "single": (False, ["--no-cache"], False),
+    "batch": (True, ["--no-cache"], False),
+    "batch-pool": (True, ["--no-cache", "--worktree-pool"], True),
+    "cached": (True, [], True),
+    "sharded": (False, ["--no-cache", "--shard-bytes", "8192"], False),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline claude-pr-review.py benchmark"
+    )
+    parser.add_argument(
+        "--prs", type=int, default=20, help="Number of synthetic PRs (default: 20)"
+    )
+    parser.add_argument(
+        "--diff-kb", type=int, default=32, help="Diff size per PR in KiB (default: 32)"
+    )
+    parser.add_argument(
+        "--files-per-pr", type=int, default=8, help="Files changed per PR (default: 8)"
+    )
+    parser.add_argument(
+        "--base-files",
+        type=int,
+        default=500,
+        help="Files in the base tree (default: 500)",
+    )
+    parser.add_argument(
+        "--base-file-kb",
+        type=int,
+        default=8,
+        help="Size of each base file in KiB (default: 8)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=8,
+        help="--jobs passed to the review script (default: 8)",
+    )
+    parser.add_argument(
+        "--claude-sleep",
+        type=float,
+        default=0.0,
+        help="Seconds each fake claude session takes (default: 0, measures pure overhead)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per scenario (default: 3)"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenario to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=1,
+        help="Seed for the synthetic content (default: 1)",
+    )
+    parser.add_argument("--json", help="Also write the results as JSON to this file")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the temporary directory"
+    )
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="bench-pr-review-"))
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    (root / "out").mkdir()
+    write_executable(bin_dir / "gh", FAKE_GH)
+    write_executable(bin_dir / "claude", FAKE_CLAUDE)
+
+    env = dict(os.environ)
+    env.update(
+        PATH=f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+        GIT_AUTHOR_NAME="bench",
+        GIT_AUTHOR_EMAIL="bench@example.invalid",
+        GIT_COMMITTER_NAME="bench",
+        GIT_COMMITTER_EMAIL="bench@example.invalid",
+        GIT_CONFIG_NOSYSTEM="1",
+        FAKE_CLAUDE_SLEEP=str(args.claude_sleep),
+    )
+
+    print(f"Building fixture with {args.prs} PRs in {root}...")
+    repo, origin, data = build_fixture(root, args, env)
+    env.update(FAKE_GH_DATA=str(data), FAKE_GH_ORIGIN=str(origin))
+    all_prs = [str(n) for n in range(1, args.prs + 1)]
+
+    results = {}
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            every_pr, extra, warm_up = SCENARIOS[name]
+            pr_numbers = all_prs if every_pr else all_prs[:1]
+            extra = [*extra, "--jobs", str(args.jobs)]
+            walls, stages, disk = [], {}, 0
+            for i in range(args.repeat):
+                reset_state(repo, env)
+                if warm_up:
+                    run_review(repo, root, env, pr_numbers, extra, f"{name}-warm{i}")
+                wall, summary = run_review(
+                    repo, root, env, pr_numbers, extra, f"{name}{i}"
+                )
+                walls.append(wall)
+                for stage, s in summary["stages"].items():
+                    stages.setdefault(stage, []).append(s)
+                disk = max(disk, dir_size(repo / "temp"))
+            wall = statistics.median(walls)
+            results[name] = {
+                "prs": len(pr_numbers),
+                "wall_s": wall,
+                "prs_per_s": len(pr_numbers) / wall,
+                "temp_disk_bytes": disk,
+                # Median across repeats of each stage's p50/p95 within a run.
+                "stages": {
+                    stage: {
+                        "p50_s": statistics.median(s["p50_s"] for s in runs),
+                        "p95_s": statistics.median(s["p95_s"] for s in runs),
+                    }
+                    for stage, runs in stages.items()
+                },
+            }
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    for name, r in results.items():
+        print(
+            f"\n{name}: {r['prs']} PR(s) in {r['wall_s']:.3f}s "
+            f"({r['prs_per_s']:.2f} PR/s), temp/ {r['temp_disk_bytes'] / 1e6:.1f} MB"
+        )
+        for stage, s in r["stages"].items():
+            print(f"  {stage:<12} p50 {s['p50_s']:>8.3f}s  p95 {s['p95_s']:>8.3f}s")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,22 @@
 # ///
 
 import argparse
+import asyncio
+import contextlib
+import contextvars
+import fcntl
+import hashlib
 import json
-import subprocess
+import math
+import os
+import re
+import shlex
+import shutil
+import signal
+import stat
 import sys
+import tempfile
+import time
 from pathlib import Path
 
 PROMPT = """You are a critical and brutally honest senior software engineer tasked with reviewing a GitHub pull request (PR). Your goal is to provide a thorough and insightful review, identifying potential issues, suggesting improvements, and ensuring the code meets high quality standards.
@@ -16,7 +29,7 @@ Level of thinking: {level_of_thinking}
 
 First, carefully read and internalize the guidelines provided in CLAUDE.md
 
-Now, review the code changes in the GitHub PR {pr_number} (this branch). Use "gh pr diff {pr_number}" to get the diff of the changes.
+Now, review the code changes in the GitHub PR {pr_number} (this branch). {diff_instruction}
 
 As you review the code, use subagents for detailed analysis. To do this, break down the review into specific aspects (e.g., code style, performance, security, etc.) and analyze each aspect separately. Synthesize the findings from these subagents in your final review.
 
@@ -41,7 +54,7 @@ Write your review in the following format:
 Begin your review with the title "# PR Review for PR{pr_number}" and write the entire review in markdown format. Your review should be comprehensive, insightful, and actionable.
 
 Remember to think critically and provide a thorough analysis. Your goal is to ensure the highest code quality and to help improve the overall codebase.
-Write the report to CLAUDE_REVIEW_PR{pr_number}.md."""
+Write the report to {review_file}."""
 
 PROMPT_JUNIOR = """You are a curious junior developer tasked with reviewing a pull request. Your goal is to understand the code changes and ask insightful questions about the implementation. Here's how you should approach this task:
 
@@ -49,7 +62,7 @@ Level of thinking: {level_of_thinking}
 
 First, carefully read and internalize the guidelines provided in CLAUDE.md
 
-Now, review the code changes in the GitHub PR {pr_number} (this branch). Use "gh pr diff {pr_number}" to get the diff of the changes. As you review the code, use subagents for detailed analysis
+Now, review the code changes in the GitHub PR {pr_number} (this branch). {diff_instruction} As you review the code, use subagents for detailed analysis
 
 As you review the code, follow these guidelines:
 
@@ -92,127 +105,1628 @@ I'm looking forward to learning from the answers to these questions and gaining
 
 Remember, your goal is to demonstrate curiosity and a desire to learn, while also providing a thoughtful review of the code changes.
 
-Write the report to CLAUDE_REVIEW_PR{pr_number}.md."""
+Write the report to {review_file}."""
 
+# Built-in reviewers for --reviewer-type; --reviewer-prompt adds custom ones.
+REVIEWERS = {"senior": PROMPT, "junior": PROMPT_JUNIOR}
 
-def run_command(cmd, cwd=None, capture=True):
+DIFF_INSTRUCTION = 'Read the diff of the changes from {diff_file} (the output of "gh pr diff {pr_number}", prefetched for you; do not run gh yourself).'
+
+INCREMENTAL_DIFF_INSTRUCTION = """This PR was already reviewed at commit {base_sha} and the previous review is in {previous_review_file}. Review only the commits pushed since then: use "git log {base_sha}..{head_sha}" and "git diff {base_sha}..{head_sha}" to get them, and the whole PR diff in {diff_file} (prefetched for you; do not run gh yourself) only for context. Do not repeat findings from the previous review, but say which of its issues the new commits fix."""
+
+SHARD_DIFF_INSTRUCTION = """This PR is too large for one session, so its diff has been split into {shard_count} parts that are reviewed in parallel. You review part {shard_number} only: read its diff from {shard_diff_file} (the whole diff is in {diff_file} if you need context). Part {shard_number} covers these files:
+{shard_files}
+Only comment on other files where the changes in this part affect them."""
+
+SYNTHESIS_PROMPT = """You are merging partial reviews of the GitHub PR {pr_number}. The PR was too large for one session, so its diff was split into {shard_count} parts that were reviewed separately. The partial reviews are in {part_files}.
+
+Do not review the code again. Combine the partial reviews into a single review that:
+1. Keeps the structure and format the partial reviews use.
+2. Merges duplicate or overlapping findings, keeping the most specific explanation and code suggestions.
+3. Orders issues by severity and calls out issues that span several parts.
+4. Ends with one overall conclusion.
+
+Write the report to {review_file}."""
+
+
+class CommandError(Exception):
+    """A command run through run_command exited with a non-zero status."""
+
+
+class ReviewError(Exception):
+    """A review could not be completed."""
+
+
+def pr_logger(pr_number, prefixed):
+    """Return a print-like function that tags lines with the PR number in batch mode."""
+
+    def log(message):
+        print(f"[PR #{pr_number}] {message}" if prefixed else message, flush=True)
+
+    return log
+
+
+# The PR a task is reviewing, so commands it runs are attributed in the run report.
+CURRENT_PR = contextvars.ContextVar("current_pr", default=None)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class RunReport:
+    """Wall time, exit status and output size of every step and command in a run.
+
+    Steps are recorded with the `stage` context manager and commands by
+    run_command. Records are tagged with the PR from CURRENT_PR (None for
+    run-wide work such as the shared fetch).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.records = []
+
+    def add(self, kind, name, start, duration, exit_status, output_bytes, error=None):
+        self.records.append(
+            {
+                "type": kind,
+                "pr": CURRENT_PR.get(),
+                "name": name,
+                "start": start,
+                "duration_s": round(duration, 6),
+                "exit_status": exit_status,
+                "output_bytes": output_bytes,
+                "error": error,
+            }
+        )
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed step; the body may set info["output_bytes"]."""
+        info = {"output_bytes": None}
+        start = time.time()
+        began = time.perf_counter()
+        error = None
+        try:
+            yield info
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add(
+                "stage",
+                name,
+                start,
+                time.perf_counter() - began,
+                exit_status=1 if error else 0,
+                output_bytes=info["output_bytes"],
+                error=error,
+            )
+
+    def summary(self):
+        """Per-stage count, total, p50 and p95 wall time across the run."""
+        durations = {}
+        for record in self.records:
+            if record["type"] == "stage":
+                durations.setdefault(record["name"], []).append(record["duration_s"])
+        stages = {}
+        for name, values in durations.items():
+            values.sort()
+            stages[name] = {
+                "count": len(values),
+                "total_s": round(sum(values), 6),
+                "p50_s": percentile(values, 0.5),
+                "p95_s": percentile(values, 0.95),
+            }
+        return {
+            "type": "summary",
+            "start": self.started,
+            "wall_s": round(time.time() - self.started, 6),
+            "stages": stages,
+        }
+
+    def print_summary(self):
+        stages = self.summary()["stages"]
+        if not stages:
+            return
+        print("Timing (count, p50, p95, total):")
+        for name, s in stages.items():
+            print(
+                f"  {name:<12} {s['count']:>4}  {s['p50_s']:>9.3f}s"
+                f"  {s['p95_s']:>9.3f}s  {s['total_s']:>9.3f}s"
+            )
+
+    def write_jsonl(self, path):
+        with open(path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in self.records)
+            f.write(json.dumps(self.summary()) + "\n")
+
+    def write_chrome_trace(self, path):
+        """Write the records in Chrome trace event format (chrome://tracing, Perfetto)."""
+        events = []
+        threads = {}
+        for record in self.records:
+            pr = record["pr"]
+            tid = threads.setdefault(pr, len(threads))
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": record["type"],
+                    "ph": "X",
+                    "ts": round((record["start"] - self.started) * 1e6),
+                    "dur": round(record["duration_s"] * 1e6),
+                    "pid": 1,
+                    "tid": tid,
+                    "args": {
+                        "exit_status": record["exit_status"],
+                        "output_bytes": record["output_bytes"],
+                        "error": record["error"],
+                    },
+                }
+            )
+        for pr, tid in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 1,
+                    "tid": tid,
+                    "args": {"name": f"PR #{pr}" if pr is not None else "run"},
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+REPORT = RunReport()
+
+
+async def run_command(cmd, cwd=None, capture=True, log=print):
     """Run a shell command and return the result."""
-    print(f"Running: {cmd}")
-    result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=capture, text=True)
-    if result.returncode != 0:
-        print(f"Command failed: {cmd}")
-        print(f"Error: {result.stderr}")
-        sys.exit(1)
-    return result.stdout.strip() if capture else None
+    log(f"Running: {cmd}")
+    start = time.time()
+    began = time.perf_counter()
+    pipe = asyncio.subprocess.PIPE if capture else None
+    proc = await asyncio.create_subprocess_shell(cmd, cwd=cwd, stdout=pipe, stderr=pipe)
+    stdout, stderr = await proc.communicate()
+    REPORT.add(
+        "command",
+        cmd,
+        start,
+        time.perf_counter() - began,
+        exit_status=proc.returncode,
+        output_bytes=len(stdout or b"") + len(stderr or b"") if capture else None,
+    )
+    if proc.returncode != 0:
+        log(f"Command failed: {cmd}")
+        log(f"Error: {stderr.decode(errors='replace') if stderr else ''}")
+        raise CommandError(f"{cmd} exited with status {proc.returncode}")
+    return stdout.decode(errors="replace").strip() if capture else None
 
 
-def main():
-    parser = argparse.ArgumentParser(description="PR Review Script")
-    parser.add_argument("pr_number", help="PR number to review")
-    parser.add_argument(
-        "--use-existing-worktree",
-        action="store_true",
-        help="Use existing worktree vs recreating worktree (clean one)",
+async def kill_process_tree(proc, grace=5):
+    """SIGTERM the process group led by proc, then SIGKILL whatever is left."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        await asyncio.wait_for(proc.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+async def run_claude(claude_cmd, cwd, log, log_path, timeout, idle_timeout):
+    """Run a claude session, streaming its output to the console and log_path.
+
+    Returns (exit status, output bytes). Raises ReviewError when the session runs
+    for more than timeout seconds or prints nothing for idle_timeout seconds (0
+    disables either limit). claude runs in its own process group, which is
+    killed on timeout, error or cancellation (Ctrl-C, SIGTERM).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    output_bytes = 0
+    pending = b""
+
+    with open(log_path, "wb") as log_file:
+        proc = await asyncio.create_subprocess_exec(
+            *claude_cmd,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            while True:
+                wait = idle_timeout or None
+                if deadline is not None:
+                    remaining = max(0, deadline - loop.time())
+                    wait = min(wait, remaining) if wait else remaining
+                try:
+                    chunk = await asyncio.wait_for(proc.stdout.read(65536), wait)
+                except asyncio.TimeoutError:
+                    if deadline is not None and loop.time() >= deadline:
+                        raise ReviewError(
+                            f"claude timed out after {timeout}s"
+                        ) from None
+                    raise ReviewError(
+                        f"claude printed nothing for {idle_timeout}s"
+                    ) from None
+                if not chunk:
+                    break
+                output_bytes += len(chunk)
+                log_file.write(chunk)
+                log_file.flush()
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    log(line.decode(errors="replace"))
+            if pending:
+                log(pending.decode(errors="replace"))
+
+            remaining = max(0, deadline - loop.time()) if deadline is not None else None
+            try:
+                await asyncio.wait_for(proc.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise ReviewError(f"claude timed out after {timeout}s") from None
+        finally:
+            if proc.returncode is None:
+                log("Stopping claude and its child processes...")
+                await kill_process_tree(proc)
+
+    return proc.returncode, output_bytes
+
+
+def dir_size(path):
+    """Return the apparent size in bytes of every regular file under path."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                total += st.st_size
+    return total
+
+
+async def is_worktree(worktree_dir, log):
+    """Whether git run in worktree_dir operates on that worktree itself.
+
+    A directory left without its .git file (an interrupted add or remove) is a
+    plain directory, and git run there would act on the main checkout.
+    """
+    try:
+        top = await run_command(
+            f"git -C {shlex.quote(str(worktree_dir))} rev-parse --show-toplevel",
+            log=log,
+        )
+    except CommandError:
+        return False
+    return Path(top).resolve() == worktree_dir.resolve()
+
+
+class WorktreePool:
+    """Warm worktrees under temp/ that are recycled between reviews.
+
+    Slot i lives in temp/golem-vanity.market-pool-<i> and is leased by taking an
+    exclusive flock on the sibling .lock file, so two reviews (even from two
+    invocations of this script) never share a tree. The lock file's mtime is the
+    slot's last use and its content the slot's size, measured when the slot is
+    released so eviction does not walk every tree; once the slots outgrow the
+    disk budget the least recently used idle ones are removed.
+    """
+
+    def __init__(self, run, size, disk_budget_bytes):
+        self.run = run
+        self.size = size
+        self.disk_budget_bytes = disk_budget_bytes
+
+    def slot_dir(self, index):
+        return self.run.temp_dir_for_ws / f"golem-vanity.market-pool-{index}"
+
+    def lock_file(self, index):
+        return self.run.temp_dir_for_ws / f"golem-vanity.market-pool-{index}.lock"
+
+    def last_used(self, index):
+        try:
+            return self.lock_file(index).stat().st_mtime
+        except FileNotFoundError:
+            return 0
+
+    def recorded_size(self, index):
+        """The slot size measured at its last release, or None if never measured."""
+        try:
+            return int(self.lock_file(index).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def try_lock(self, index):
+        """Return an fd holding the slot's lock, or None if it is leased."""
+        fd = os.open(self.lock_file(index), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def try_lease(self):
+        """Lock a free slot, preferring warm ones; return (index, fd) or None."""
+        self.run.temp_dir_for_ws.mkdir(exist_ok=True)
+        indexes = range(self.size)
+        warm = sorted(
+            (i for i in indexes if self.slot_dir(i).exists()),
+            key=self.last_used,
+            reverse=True,
+        )
+        cold = [i for i in indexes if i not in warm]
+        for index in warm + cold:
+            fd = self.try_lock(index)
+            if fd is not None:
+                return index, fd
+        return None
+
+    @contextlib.asynccontextmanager
+    async def lease(self, sha, log):
+        """Lease a slot checked out (detached) at sha and yield its path."""
+        with REPORT.stage("pool-wait"):
+            leased = self.try_lease()
+            if leased is None:
+                log("Waiting for a free worktree in the pool...")
+            while leased is None:
+                await asyncio.sleep(1)
+                leased = self.try_lease()
+        index, fd = leased
+        worktree_dir = self.slot_dir(index)
+        try:
+            with REPORT.stage("worktree"):
+                await self.recycle(worktree_dir, sha, log)
+            yield worktree_dir
+            with REPORT.stage("pool-size"):
+                size = await asyncio.get_running_loop().run_in_executor(
+                    None, dir_size, worktree_dir
+                )
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, str(size).encode(), 0)
+        finally:
+            os.utime(self.lock_file(index))
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        # The review is done by now, so trimming the pool must not fail it.
+        with REPORT.stage("pool-evict"):
+            try:
+                await self.evict(log)
+            except (CommandError, OSError) as e:
+                log(f"Could not trim the worktree pool: {e}")
+
+    async def discard(self, worktree_dir, log):
+        """Remove a slot, logging rather than raising on failure.
+
+        A slot that is not a registered worktree is deleted and pruned instead
+        of being handed to `git worktree remove`, which would refuse it.
+        """
+        if await is_worktree(worktree_dir, log):
+            async with self.run.worktree_lock:
+                try:
+                    await run_command(
+                        f"git worktree remove {shlex.quote(str(worktree_dir))} --force",
+                        log=log,
+                    )
+                    return
+                except CommandError as e:
+                    log(f"Could not remove worktree: {e}")
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        async with self.run.worktree_lock:
+            try:
+                await run_command("git worktree prune", log=log)
+            except CommandError as e:
+                log(f"Could not prune worktrees: {e}")
+
+    async def recycle(self, worktree_dir, sha, log):
+        """Point the slot at sha with a clean tree, creating it if needed."""
+        quoted = shlex.quote(str(worktree_dir))
+        if worktree_dir.exists() and not await is_worktree(worktree_dir, log):
+            log(
+                f"Pooled worktree {worktree_dir} is not a git worktree, recreating it..."
+            )
+            await self.discard(worktree_dir, log)
+        if worktree_dir.exists():
+            log(f"Recycling pooled worktree {worktree_dir}...")
+            try:
+                await run_command(
+                    f"git -C {quoted} checkout --force --detach {sha}", log=log
+                )
+                await run_command(f"git -C {quoted} clean -ffdx --quiet", log=log)
+                return
+            except CommandError:
+                log("Pooled worktree is broken, recreating it...")
+                await self.discard(worktree_dir, log)
+        async with self.run.worktree_lock:
+            await run_command("git worktree prune", log=log)
+            await run_command(f"git worktree add --detach {quoted} {sha}", log=log)
+
+    async def evict(self, log):
+        """Remove least recently used idle slots until the pool fits its budget."""
+        loop = asyncio.get_running_loop()
+        slots = [i for i in range(self.size) if self.slot_dir(i).exists()]
+        sizes = {}
+        for index in slots:
+            sizes[index] = self.recorded_size(index)
+            if sizes[index] is None:
+                # Created by a review that failed or was interrupted.
+                sizes[index] = await loop.run_in_executor(
+                    None, dir_size, self.slot_dir(index)
+                )
+        total = sum(sizes.values())
+        for index in sorted(slots, key=self.last_used):
+            if total <= self.disk_budget_bytes:
+                break
+            fd = self.try_lock(index)
+            if fd is None:
+                continue
+            try:
+                worktree_dir = self.slot_dir(index)
+                log(f"Evicting pooled worktree {worktree_dir} (pool over disk budget)")
+                await self.discard(worktree_dir, log)
+                if not worktree_dir.exists():
+                    os.ftruncate(fd, 0)
+                    total -= sizes[index]
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+def write_atomically(path, text):
+    """Write text to path via a temp file so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ReviewCache:
+    """Finished reviews under temp/review-cache, keyed by everything that shapes them.
+
+    The key hashes the PR head SHA, the formatted prompt, the reviewer name, the
+    level of thinking and the work dir, so a hit is only possible when claude
+    would be asked the same question about the same code. Entries are evicted
+    least recently used first once the cache outgrows max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats_file = cache_dir / "stats.json"
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(head_sha, prompt, reviewer, level_of_thinking, work_dir):
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        parts = [
+            head_sha,
+            prompt_hash,
+            reviewer,
+            level_of_thinking,
+            work_dir or "",
+        ]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def entry(self, key):
+        return self.cache_dir / f"{key}.md"
+
+    def get(self, key):
+        """Return the cached review for key, or None on a miss."""
+        entry = self.entry(key)
+        try:
+            review = entry.read_text()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(entry)
+        self.hits += 1
+        return review
+
+    def put(self, key, review):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.entry(key), review)
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes."""
+        entries = []
+        for entry in self.cache_dir.glob("*.md"):
+            try:
+                entries.append((entry.stat(), entry))
+            except FileNotFoundError:
+                continue
+        total = sum(st.st_size for st, _ in entries)
+        for st, entry in sorted(entries, key=lambda e: e[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= st.st_size
+
+    def save_stats(self):
+        """Add this run's hits and misses to the lifetime totals; return the totals."""
+        try:
+            totals = json.loads(self.stats_file.read_text())
+        except (FileNotFoundError, ValueError):
+            totals = {"hits": 0, "misses": 0}
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.stats_file, json.dumps(totals))
+        return totals
+
+
+class ReviewRun:
+    """State shared by every review started from one invocation of the script."""
+
+    def __init__(self, args, git_top_dir, batch):
+        self.args = args
+        self.batch = batch
+        self.git_top_dir = Path(git_top_dir)
+        self.temp_dir_for_ws = self.git_top_dir / "temp"
+        self.output_dir = Path(args.output_dir) if args.output_dir else Path.cwd()
+        # [(name, prompt template)] run side by side on every PR.
+        self.reviewers = args.reviewers
+        # Caps the number of claude sessions running at the same time.
+        self.claude_slots = asyncio.Semaphore(args.jobs)
+        # `git worktree add/remove` touch shared state in .git, so run them one at a time.
+        self.worktree_lock = asyncio.Lock()
+        self.pool = None
+        if args.worktree_pool:
+            self.pool = WorktreePool(
+                self,
+                size=args.pool_size or args.jobs,
+                disk_budget_bytes=args.pool_disk_budget_mb * 1024 * 1024,
+            )
+        # Remembers the head SHA of the last review of each PR for --incremental.
+        self.state_dir = self.temp_dir_for_ws / "review-state"
+        self.prefetch_cache = PrefetchCache(
+            self.temp_dir_for_ws / "prefetch", ttl=args.prefetch_ttl
+        )
+        # {pr_number: info or exception}, filled in by prefetch_prs.
+        self.prs = {}
+        self.cache = None
+        if not args.no_cache:
+            self.cache = ReviewCache(
+                self.temp_dir_for_ws / "review-cache",
+                max_bytes=args.cache_max_mb * 1024 * 1024,
+            )
+
+
+@contextlib.asynccontextmanager
+async def branch_worktree(run, pr_number, branch_name, head_sha, log):
+    """Yield a worktree for the PR at head_sha, (re)created under temp/ unless reused."""
+    # The PR number keeps fork PRs that share a branch name (patch-1, main) apart.
+    branch_dir_postfix = branch_name.replace("/", "-")
+    temp_dir_for_ws = run.temp_dir_for_ws
+    worktree_dir = (
+        temp_dir_for_ws / f"golem-vanity.market-PR{pr_number}-{branch_dir_postfix}"
     )
-    parser.add_argument(
-        "--reviewer-type",
-        choices=["senior", "junior"],
-        default="senior",
-        help="Type of reviewer (senior or junior). Senior is default.",
+
+    with REPORT.stage("worktree"):
+        async with run.worktree_lock:
+            temp_dir_for_ws.mkdir(exist_ok=True)
+
+            # Remove existing worktree if it exists and not using existing
+            if not run.args.use_existing_worktree and worktree_dir.exists():
+                log("Removing existing worktree...")
+                await run_command(
+                    f"git worktree remove {shlex.quote(str(worktree_dir))} --force",
+                    log=log,
+                )
+
+            if not worktree_dir.exists():
+                await run_command(
+                    f"git worktree add --detach {shlex.quote(str(worktree_dir))} {head_sha}",
+                    log=log,
+                )
+            else:
+                # Move it to head_sha so the review matches its cache key; without
+                # --force, so local edits in the reused tree are never discarded.
+                log("Using existing worktree...")
+                if not await is_worktree(worktree_dir, log):
+                    raise ReviewError(
+                        f"{worktree_dir} is not a git worktree; rerun without --use-existing-worktree"
+                    )
+                try:
+                    await run_command(
+                        f"git -C {shlex.quote(str(worktree_dir))} checkout --detach {head_sha}",
+                        log=log,
+                    )
+                except CommandError as e:
+                    raise ReviewError(
+                        f"could not move existing worktree {worktree_dir} to {head_sha[:12]}"
+                        " (local changes?); rerun without --use-existing-worktree"
+                    ) from e
+
+    failed = True
+    try:
+        yield worktree_dir
+        failed = False
+    finally:
+        # Same as do-pr-review-cleanup.sh; a reused worktree is only removed on request.
+        if run.args.cleanup_worktree or (failed and not run.args.use_existing_worktree):
+            await remove_worktree(run, worktree_dir, log)
+
+
+async def remove_worktree(run, worktree_dir, log):
+    """Remove a review worktree, logging rather than raising on failure."""
+    log(f"Removing worktree {worktree_dir}...")
+    async with run.worktree_lock:
+        try:
+            await run_command(
+                f"git worktree remove {shlex.quote(str(worktree_dir))} --force", log=log
+            )
+        except CommandError as e:
+            log(f"Could not remove worktree: {e}")
+
+
+PR_FIELDS = "number,title,headRefName,headRefOid,baseRefName"
+
+# The same fields in GraphQL, where they have the same names.
+PR_GRAPHQL_FIELDS = " ".join(PR_FIELDS.split(","))
+
+
+async def fetch_pr_view(pr_number, log=print):
+    return json.loads(
+        await run_command(f"gh pr view {pr_number} --json {PR_FIELDS}", log=log)
     )
-    parser.add_argument(
-        "--work-dir",
-        help="Directory within the worktree where claude should run (default: worktree root)",
+
+
+async def fetch_pr_infos(pr_numbers):
+    """Metadata for many PRs from a single GraphQL call: {pr_number: info}."""
+    aliases = "\n".join(
+        f"    pr{n}: pullRequest(number: {n}) {{ {PR_GRAPHQL_FIELDS} }}"
+        for n in pr_numbers
     )
-    parser.add_argument(
-        "--output-dir",
-        help="Directory where review file should be written (default: current directory)",
+    query = (
+        "query($owner: String!, $repo: String!) {\n"
+        f"  repository(owner: $owner, name: $repo) {{\n{aliases}\n  }}\n}}"
     )
-    parser.add_argument(
-        "--level-of-thinking",
-        choices=["think", "think hard", "think harder", "ultrathink"],
-        default="think",
-        help="Level of thinking intensity for the review (default: think)",
+    response = await run_command(
+        f"gh api graphql -F owner='{{owner}}' -F repo='{{repo}}' -f query={shlex.quote(query)}"
     )
+    repository = json.loads(response)["data"]["repository"]
+    return {n: dict(repository[f"pr{n}"]) for n in pr_numbers}
+
+
+class PrefetchCache:
+    """PR metadata and diffs under temp/prefetch, reused for ttl seconds.
+
+    Review prompts point claude at the stored diff instead of `gh pr diff`, so a
+    review session needs no GitHub round-trips of its own.
+    """
+
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def info_file(self, pr_number):
+        return self.cache_dir / f"PR{pr_number}.json"
+
+    def diff_file(self, pr_number):
+        return self.cache_dir / f"PR{pr_number}.diff"
+
+    def load(self, pr_number):
+        """Return the stored metadata if it is younger than the TTL, else None."""
+        try:
+            entry = json.loads(self.info_file(pr_number).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        if not self.diff_file(pr_number).exists():
+            return None
+        return entry["info"]
+
+    def store(self, pr_number, info, diff):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.diff_file(pr_number), diff)
+        write_atomically(
+            self.info_file(pr_number),
+            json.dumps({"fetched_at": time.time(), "info": info}),
+        )
+
+    def diff(self, pr_number):
+        return self.diff_file(pr_number).read_text()
+
+
+async def fetch_pr_refs(infos):
+    """Fetch the head of every PR and its base branch with one targeted `git fetch`."""
+    refspecs = []
+    for n, info in infos.items():
+        refspecs.append(f"+refs/pull/{n}/head:refs/remotes/origin/pr/{n}")
+        base = info["baseRefName"]
+        refspecs.append(f"+refs/heads/{base}:refs/remotes/origin/{base}")
+    refspecs = list(dict.fromkeys(refspecs))
+    await run_command(f"git fetch origin {' '.join(map(shlex.quote, refspecs))}")
+
+
+async def pr_diff(pr_number, info):
+    """The PR diff from local objects, falling back to `gh pr diff`."""
+    base = shlex.quote(f"origin/{info['baseRefName']}")
+    # Pin every option the user's git config could change, so the output
+    # matches `gh pr diff` and split_diff_by_file can parse it.
+    try:
+        return await run_command(
+            "git -c core.quotePath=false diff --no-ext-diff --no-color --no-textconv"
+            f" --src-prefix=a/ --dst-prefix=b/ {base}...{info['headRefOid']}"
+        )
+    except CommandError:
+        return await run_command(f"gh pr diff {pr_number}")
+
+
+async def fetch_remote_pr_heads(pr_numbers):
+    """Current head SHA of each PR on origin from one `git ls-remote`: {pr_number: sha}."""
+    refs = " ".join(f"refs/pull/{n}/head" for n in pr_numbers)
+    heads = {}
+    for line in (await run_command(f"git ls-remote origin {refs}")).splitlines():
+        sha, _, ref = line.partition("\t")
+        heads[ref.split("/")[2]] = sha
+    return heads
+
+
+async def prefetch_prs(run, pr_numbers, listed):
+    """Gather metadata and diffs for every PR up front: {pr_number: info or error}.
+
+    PRs listed by --query use the fresh `gh pr list` response and the rest
+    share one GraphQL call. A diff younger than --prefetch-ttl is reused from
+    the PrefetchCache, but only while the PR head is still the cached one: the
+    listing says so for --query PRs and one `git ls-remote` checks the others.
+    Heads and base branches come from one targeted `git fetch` and the diffs
+    are computed locally.
+    """
+    cache = run.prefetch_cache
+    cached = {}
+    for n in pr_numbers:
+        info = cache.load(n)
+        if info is None:
+            continue
+        if n in listed and listed[n]["headRefOid"] != info["headRefOid"]:
+            continue
+        cached[n] = info
+    unlisted = [n for n in cached if n not in listed]
+    if unlisted:
+        with REPORT.stage("pr-heads"):
+            try:
+                heads = await fetch_remote_pr_heads(unlisted)
+            except CommandError as e:
+                print(f"Could not check PR heads ({e}), refreshing their metadata...")
+                heads = {}
+        for n in unlisted:
+            if heads.get(n) != cached[n]["headRefOid"]:
+                del cached[n]
+    prs = {**cached, **{n: listed[n] for n in pr_numbers if n in listed}}
+    cached = set(cached)
+    if cached:
+        print(f"Reusing prefetched diffs for PR(s) {', '.join(sorted(cached))}")
+
+    to_query = [n for n in pr_numbers if n not in prs]
+    if to_query:
+        with REPORT.stage("pr-info"):
+            try:
+                prs.update(await fetch_pr_infos(to_query))
+            except (CommandError, KeyError, TypeError, ValueError) as e:
+                # One bad PR number fails the whole query; look the PRs up one by one.
+                print(f"Batched PR lookup failed ({e}), falling back to gh pr view...")
+                views = await asyncio.gather(
+                    *(fetch_pr_view(n) for n in to_query), return_exceptions=True
+                )
+                prs.update(zip(to_query, views))
+
+    ok = {n: info for n, info in prs.items() if not isinstance(info, Exception)}
+    missing_heads = [
+        n
+        for n, info in ok.items()
+        if n not in cached
+        or not await command_succeeds(
+            f"git cat-file -e {info['headRefOid']}^{{commit}}"
+        )
+    ]
+    if missing_heads:
+        with REPORT.stage("fetch"):
+            try:
+                await fetch_pr_refs({n: ok[n] for n in missing_heads})
+            except CommandError:
+                print("Batched fetch failed, fetching PRs one by one...")
+                for n in missing_heads:
+                    try:
+                        await fetch_pr_refs({n: ok[n]})
+                    except CommandError as e:
+                        prs[n] = e
+
+    fresh = [n for n in ok if n not in cached and not isinstance(prs[n], Exception)]
+    if fresh:
+        with REPORT.stage("diff"):
+            diffs = await asyncio.gather(
+                *(pr_diff(n, prs[n]) for n in fresh), return_exceptions=True
+            )
+        for n, diff in zip(fresh, diffs):
+            if isinstance(diff, Exception):
+                prs[n] = diff
+            else:
+                cache.store(n, prs[n], diff)
+    return prs
+
+
+# The escapes git uses in quoted paths, besides three-digit octal bytes.
+GIT_PATH_ESCAPES = dict(zip(b'abtnvfr"\\', b'\a\b\t\n\v\f\r"\\'))
 
-    args = parser.parse_args()
-    pr_number = args.pr_number
 
-    print(f"Reviewing PR #{pr_number}...")
+def unescape_git_byte(match):
+    escape = match.group(1)
+    if len(escape) == 3:
+        return bytes([int(escape, 8)])
+    return bytes([GIT_PATH_ESCAPES.get(escape[0], escape[0])])
 
-    # Step 1: Fetch PR Information
-    print("Step 1: Fetching PR information...")
-    run_command("git fetch")
 
-    # Get PR details
-    pr_info_json = run_command(f"gh pr view {pr_number} --json headRefName,title,files")
-    pr_info = json.loads(pr_info_json)
+def unquote_git_path(path):
+    """Undo the quoting git applies to paths with unusual characters in them."""
+    path = path.rstrip("\t")
+    if not (len(path) > 1 and path.startswith('"') and path.endswith('"')):
+        return path
+    raw = re.sub(rb"\\([0-7]{3}|.)", unescape_git_byte, path[1:-1].encode())
+    return raw.decode(errors="replace")
+
+
+def diff_section_path(section):
+    """The path a `diff --git` section changes, preferring its ---/+++ lines."""
+    lines = []
+    for line in section.splitlines():
+        # Stop before the hunks: an added "++ x" line reads "+++ x".
+        if line.startswith(("@@", "Binary files ", "GIT binary patch")):
+            break
+        lines.append(line)
+    for prefix, side in (("+++ ", "b/"), ("--- ", "a/"), ("rename to ", "")):
+        for line in lines:
+            if line.startswith(prefix) and line != f"{prefix}/dev/null":
+                path = unquote_git_path(line[len(prefix) :])
+                return path[len(side) :] if path.startswith(side) else path
+    # Mode-only and binary changes only have the header, which names the
+    # same path twice: "a/<path> b/<path>", each side quoted if needed.
+    header = lines[0][len("diff --git ") :]
+    if header.startswith('"'):
+        return unquote_git_path(re.match(r'"(?:[^"\\]|\\.)*"', header).group(0))[2:]
+    return header[2 : 2 + (len(header) - 5) // 2]
+
+
+def split_diff_by_file(diff):
+    """Map each path in a `git diff` to its section of the diff."""
+    sections = {}
+    for section in re.split(r"(?m)^(?=diff --git )", diff):
+        if section.startswith("diff --git "):
+            sections[diff_section_path(section)] = section
+    return sections
+
+
+def plan_shards(file_sizes, budget):
+    """Split {path: diff bytes} into shards of about budget bytes each.
+
+    Files stay grouped by top-level directory where the directory fits in the
+    budget; larger directories are cut into runs of neighbouring paths. The
+    pieces are then packed first-fit decreasing. A single file larger than the
+    budget gets a shard of its own.
+    """
+    directories = {}
+    for path, size in file_sizes.items():
+        top = path.split("/", 1)[0] if "/" in path else "."
+        directories.setdefault(top, {})[path] = size
+
+    pieces = []
+    for files in directories.values():
+        paths, size = [], 0
+        for path in sorted(files):
+            if paths and size + files[path] > budget:
+                pieces.append((size, paths))
+                paths, size = [], 0
+            paths.append(path)
+            size += files[path]
+        pieces.append((size, paths))
+
+    shards = []
+    for size, paths in sorted(pieces, key=lambda piece: -piece[0]):
+        for shard in shards:
+            if shard[0] + size <= budget:
+                shard[0] += size
+                shard[1].extend(paths)
+                break
+        else:
+            shards.append([size, list(paths)])
+    return [sorted(paths) for _, paths in shards]
+
+
+def shard_pr(diff, budget):
+    """Return [(paths, shard diff)] for a diff larger than budget bytes, else []."""
+    if not budget or len(diff.encode()) <= budget:
+        return []
+    sections = split_diff_by_file(diff)
+    file_sizes = {path: len(section.encode()) for path, section in sections.items()}
+    shards = plan_shards(file_sizes, budget)
+    if len(shards) < 2:
+        return []
+    return [(paths, "".join(sections[path] for path in paths)) for paths in shards]
+
+
+def review_settings(run, target_file):
+    """What besides the code shapes a PR's review file; an update must match it."""
+    return {
+        "reviewers": [
+            [name, hashlib.sha256(prompt.encode()).hexdigest()]
+            for name, prompt in run.reviewers
+        ],
+        "level_of_thinking": run.args.level_of_thinking,
+        "work_dir": run.args.work_dir or "",
+        "review_file": str(target_file.resolve()),
+    }
+
+
+def load_review_state(run, pr_number):
+    """Return what the last successful review of the PR covered, if any."""
+    try:
+        return json.loads((run.state_dir / f"PR{pr_number}.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_review_state(run, pr_number, head_sha, target_file):
+    run.state_dir.mkdir(parents=True, exist_ok=True)
+    state = {"head_sha": head_sha, **review_settings(run, target_file)}
+    write_atomically(run.state_dir / f"PR{pr_number}.json", json.dumps(state))
+
+
+async def command_succeeds(cmd, cwd=None):
+    """Run a shell command quietly and report whether it exited with status 0."""
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await proc.wait() == 0
+
+
+async def incremental_base(run, pr_number, head_sha, target_file, log):
+    """Return the SHA an --incremental review can start from, or None for a full one."""
+    state = load_review_state(run, pr_number)
+    if state is None or not target_file.exists():
+        log("No previous review found, doing a full review...")
+        return None
+    settings = review_settings(run, target_file)
+    if any(state.get(key) != value for key, value in settings.items()):
+        log(
+            "The previous review used other reviewers, settings or output file,"
+            " doing a full review..."
+        )
+        return None
+    base_sha = state["head_sha"]
+    if base_sha == head_sha:
+        return base_sha
+    if not await command_succeeds(
+        f"git merge-base --is-ancestor {base_sha} {head_sha}", cwd=run.git_top_dir
+    ):
+        log(
+            f"{base_sha[:12]} is not an ancestor of the PR head, doing a full review..."
+        )
+        return None
+    return base_sha
+
+
+def merge_incremental_review(previous_review, review, base_sha, head_sha):
+    """Append an incremental review to the review it follows up on."""
+    return (
+        f"{previous_review.rstrip()}\n\n---\n\n"
+        f"## Update: commits {base_sha[:12]}..{head_sha[:12]}\n\n"
+        f"{review.strip()}\n"
+    )
+
+
+async def review_pr(run, pr_number):
+    """Review a single PR and return the path of the review file."""
+    args = run.args
+    log = pr_logger(pr_number, run.batch)
+
+    log(f"Reviewing PR #{pr_number}...")
+
+    # Step 1: PR Information (prefetched for the whole run by prefetch_prs)
+    log("Step 1: Fetching PR information...")
+    pr_info = run.prs[pr_number]
+    if isinstance(pr_info, Exception):
+        raise pr_info
 
     branch_name = pr_info["headRefName"]
-    branch_dir_postfix = branch_name.replace("/", "-")
+    head_sha = pr_info["headRefOid"]
     pr_title = pr_info["title"]
 
-    git_top_dir = run_command("git rev-parse --show-toplevel")
-    temp_dir_for_ws = Path(git_top_dir) / "temp"
-    worktree_dir = temp_dir_for_ws / f"golem-vanity.market-{branch_dir_postfix}"
+    log(f"PR Title: {pr_title}")
+    log(f"Branch: {branch_name}")
 
-    print(f"PR Title: {pr_title}")
-    print(f"Branch: {branch_name}")
+    target_file = run.output_dir / f"CLAUDE_REVIEW_PR{pr_number}.md"
 
-    # Step 2: Create Worktree
-    print("Step 2: Creating worktree...")
-    temp_dir_for_ws.mkdir(exist_ok=True)
+    base_sha = None
+    previous_review = None
+    diff_file = f"CLAUDE_PR{pr_number}.diff"
+    attachments = {diff_file: run.prefetch_cache.diff(pr_number)}
+    diff_instruction = DIFF_INSTRUCTION.format(pr_number=pr_number, diff_file=diff_file)
+    if args.incremental:
+        base_sha = await incremental_base(run, pr_number, head_sha, target_file, log)
+        if base_sha == head_sha:
+            log(f"No new commits since the last review, keeping {target_file}")
+            return target_file
+        if base_sha:
+            log(f"Reviewing only commits {base_sha[:12]}..{head_sha[:12]}")
+            previous_review = target_file.read_text()
+            previous_review_file = f"CLAUDE_PREVIOUS_REVIEW_PR{pr_number}.md"
+            attachments[previous_review_file] = previous_review
+            diff_instruction = INCREMENTAL_DIFF_INSTRUCTION.format(
+                diff_file=diff_file,
+                base_sha=base_sha,
+                head_sha=head_sha,
+                previous_review_file=previous_review_file,
+            )
 
-    # Remove existing worktree if it exists and not using existing
-    if not args.use_existing_worktree and worktree_dir.exists():
-        print("Removing existing worktree...")
-        run_command(f"git worktree remove {worktree_dir} --force")
+    # A full review of a diff larger than --shard-bytes is split into shards.
+    shards = []
+    if previous_review is None:
+        shards = shard_pr(attachments[diff_file], args.shard_bytes)
+    if shards:
+        log(
+            f"Diff is over {args.shard_bytes} bytes, reviewing it in {len(shards)} shards"
+        )
+        for number, (_paths, shard_diff) in enumerate(shards, 1):
+            attachments[f"CLAUDE_PR{pr_number}_part{number}.diff"] = shard_diff
 
-    if not worktree_dir.exists():
-        run_command(f"git worktree add {worktree_dir} {branch_name}")
-    else:
-        print("Using existing worktree...")
+    # Select and format the prompt for each reviewer; with several reviewers
+    # each one writes its own file so they can share the worktree.
+    sessions = []
+    for reviewer, prompt in run.reviewers:
+        review_file = (
+            f"CLAUDE_REVIEW_PR{pr_number}.md"
+            if len(run.reviewers) == 1
+            else f"CLAUDE_REVIEW_PR{pr_number}_{reviewer}.md"
+        )
+        formatted_prompt = prompt.format(
+            pr_number=pr_number,
+            level_of_thinking=args.level_of_thinking,
+            diff_instruction=diff_instruction,
+            review_file=review_file,
+        )
+        session = {
+            "reviewer": reviewer,
+            "prompt": formatted_prompt,
+            "review_file": review_file,
+            "shards": [],
+            "review": None,
+        }
 
-    # Step 3: Execute Review in Separate Claude Process
-    print("Step 3: Executing review in separate claude process...")
-    review_path = worktree_dir / args.work_dir if args.work_dir else worktree_dir
+        for number, (paths, _shard_diff) in enumerate(shards, 1):
+            shard_review_file = (
+                f"CLAUDE_REVIEW_PR{pr_number}_{reviewer}_part{number}.md"
+            )
+            shard_instruction = SHARD_DIFF_INSTRUCTION.format(
+                shard_count=len(shards),
+                shard_number=number,
+                shard_diff_file=f"CLAUDE_PR{pr_number}_part{number}.diff",
+                diff_file=diff_file,
+                shard_files="\n".join(f"- {path}" for path in paths),
+            )
+            session["shards"].append(
+                {
+                    "label": f"{reviewer}-part{number}",
+                    "prompt": prompt.format(
+                        pr_number=pr_number,
+                        level_of_thinking=args.level_of_thinking,
+                        diff_instruction=shard_instruction,
+                        review_file=shard_review_file,
+                    ),
+                    "review_file": shard_review_file,
+                }
+            )
+        if shards:
+            session["synthesis"] = {
+                "label": f"{reviewer}-synthesis",
+                "prompt": SYNTHESIS_PROMPT.format(
+                    pr_number=pr_number,
+                    shard_count=len(shards),
+                    part_files=", ".join(s["review_file"] for s in session["shards"]),
+                    review_file=review_file,
+                ),
+                "review_file": review_file,
+            }
+            # The shard prompts and the synthesis together decide the review.
+            formatted_prompt = "\0".join(
+                [s["prompt"] for s in session["shards"]]
+                + [session["synthesis"]["prompt"], args.synthesis_model]
+            )
+
+        session["cache_key"] = ReviewCache.key(
+            head_sha,
+            formatted_prompt,
+            reviewer,
+            args.level_of_thinking,
+            args.work_dir,
+        )
+        sessions.append(session)
+
+    if run.cache:
+        for session in sessions:
+            with REPORT.stage("cache") as stage:
+                session["review"] = run.cache.get(session["cache_key"])
+                if session["review"] is not None:
+                    stage["output_bytes"] = len(session["review"])
+            if session["review"] is not None:
+                log(f"Cache hit for {session['reviewer']} review of {head_sha[:12]}")
+
+    pending = [session for session in sessions if session["review"] is None]
+    if pending:
+        # Step 2: Create Worktree
+        log("Step 2: Creating worktree...")
+        if run.pool:
+            worktree = run.pool.lease(head_sha, log)
+        else:
+            worktree = branch_worktree(run, pr_number, branch_name, head_sha, log)
 
-    print(f"Running claude review in {review_path}...")
+        async with worktree as worktree_dir:
+            review_path = (
+                worktree_dir / args.work_dir if args.work_dir else worktree_dir
+            )
+            with attached_files(review_path, attachments):
+                results = await asyncio.gather(
+                    *(
+                        review_in_worktree(run, pr_number, review_path, session, log)
+                        for session in pending
+                    ),
+                    return_exceptions=True,
+                )
+            # Cache the sessions that succeeded even if another one failed, then
+            # raise inside the block so a failed review still removes its worktree.
+            for session, result in zip(pending, results):
+                if isinstance(result, BaseException):
+                    continue
+                session["review"] = result
+                if run.cache:
+                    run.cache.put(session["cache_key"], result)
+            for result in results:
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
 
-    # Select and format the prompt based on reviewer type
-    selected_prompt = PROMPT_JUNIOR if args.reviewer_type == "junior" else PROMPT
-    formatted_prompt = selected_prompt.format(
-        pr_number=pr_number, level_of_thinking=args.level_of_thinking
+    review = combine_reviews(
+        pr_number, {session["reviewer"]: session["review"] for session in sessions}
     )
+    with REPORT.stage("write") as stage:
+        if previous_review is not None:
+            review = merge_incremental_review(
+                previous_review, review, base_sha, head_sha
+            )
+        target_file.write_text(review)
+        save_review_state(run, pr_number, head_sha, target_file)
+        stage["output_bytes"] = len(review)
+    log(f"Review completed and saved to {target_file}")
+    log(f"PR #{pr_number} review completed successfully!")
+    return target_file
+
+
+def combine_reviews(pr_number, reviews):
+    """Merge {reviewer: review} into one report with a section per reviewer."""
+    if len(reviews) == 1:
+        return next(iter(reviews.values()))
+    sections = [f"# Combined review for PR{pr_number}"]
+    for reviewer, review in reviews.items():
+        sections.append(f"## {reviewer.capitalize()} reviewer\n\n{review.strip()}")
+    return "\n\n".join(sections) + "\n"
+
+
+@contextlib.contextmanager
+def attached_files(review_path, attachments):
+    """Write {file name: content} next to the claude sessions, removing them afterwards."""
+    for name, content in attachments.items():
+        (review_path / name).write_text(content)
+    try:
+        yield
+    finally:
+        for name in attachments:
+            (review_path / name).unlink(missing_ok=True)
+
+
+async def review_in_worktree(run, pr_number, review_path, session, log):
+    """Run one reviewer's session(s) in review_path and return the review.
+
+    A sharded session reviews its shards in parallel and then merges the partial
+    reviews in a synthesis session on the cheaper --synthesis-model.
+    """
+    if not session["shards"]:
+        return await claude_session(
+            run, pr_number, review_path, session["reviewer"], session, log
+        )
+
+    parts = await asyncio.gather(
+        *(
+            claude_session(run, pr_number, review_path, shard["label"], shard, log)
+            for shard in session["shards"]
+        ),
+        return_exceptions=True,
+    )
+    for part in parts:
+        if isinstance(part, BaseException):
+            raise part
+
+    synthesis = session["synthesis"]
+    log(f"Synthesizing {len(parts)} partial {session['reviewer']} reviews...")
+    partial_reviews = {
+        shard["review_file"]: part for shard, part in zip(session["shards"], parts)
+    }
+    with attached_files(review_path, partial_reviews):
+        return await claude_session(
+            run,
+            pr_number,
+            review_path,
+            synthesis["label"],
+            synthesis,
+            log,
+            model=run.args.synthesis_model,
+            allowed_tools="Read,Write",
+            stage_name="synthesis",
+        )
+
+
+async def claude_session(
+    run,
+    pr_number,
+    review_path,
+    label,
+    session,
+    log,
+    model=None,
+    allowed_tools="Read,Write,Bash,Glob,Grep,LS",
+    stage_name="claude",
+):
+    """Run steps 3 and 4 for one claude session and return the review it wrote."""
+    args = run.args
+
+    # Step 3: Execute Review in Separate Claude Process
+    log(f"Step 3: Executing {label} review in separate claude process...")
 
     # Run claude command
     claude_cmd = [
         "claude",
         "-d",
+        *(["--model", model] if model else []),
         "--allowedTools",
-        "Read,Write,Bash,Glob,Grep,LS",
+        allowed_tools,
         "-p",
-        formatted_prompt,
+        session["prompt"],
     ]
 
-    subprocess.run(claude_cmd, cwd=review_path)
+    with REPORT.stage("claude-wait"):
+        await run.claude_slots.acquire()
+    try:
+        with REPORT.stage(stage_name) as stage:
+            log_path = (
+                run.temp_dir_for_ws / "logs" / f"claude-PR{pr_number}-{label}.log"
+            )
+            log(f"Running claude review in {review_path} (log: {log_path})...")
+            start = time.time()
+            began = time.perf_counter()
+            returncode, output_bytes = await run_claude(
+                claude_cmd,
+                cwd=review_path,
+                log=log,
+                log_path=log_path,
+                timeout=args.timeout,
+                idle_timeout=args.idle_timeout,
+            )
+            REPORT.add(
+                "command",
+                f"claude ({label})",
+                start,
+                time.perf_counter() - began,
+                exit_status=returncode,
+                output_bytes=output_bytes,
+            )
+            stage["output_bytes"] = output_bytes
+    finally:
+        run.claude_slots.release()
 
     # Step 4: Copy Review Back
-    print("Step 4: Copying review back to target directory...")
-    review_file = review_path / f"CLAUDE_REVIEW_PR{pr_number}.md"
-
-    # Determine target directory: use --output-dir if provided, else current working directory
-    output_dir = Path(args.output_dir) if args.output_dir else Path.cwd()
-    target_file = output_dir / f"CLAUDE_REVIEW_PR{pr_number}.md"
-
-    if review_file.exists():
-        review_file.rename(target_file)
-        print(f"Review completed and saved to {target_file}")
-    else:
-        print("Warning: Review file not found")
+    log(f"Step 4: Copying {label} review back to target directory...")
+    with REPORT.stage("copy-back") as stage:
+        review_file = review_path / session["review_file"]
+
+        if not review_file.exists():
+            log("Warning: Review file not found")
+            raise ReviewError(
+                f"{label} claude session exited with status {returncode} "
+                "without a review file"
+            )
+
+        review = review_file.read_text()
+        review_file.unlink()
+        stage["output_bytes"] = len(review)
+    return review
+
+
+async def list_prs(query, limit):
+    """Return {pr_number: info} for the open PRs matching a `gh pr list --search` query."""
+    prs_json = await run_command(
+        f"gh pr list --search {shlex.quote(query)} --limit {limit} --json {PR_FIELDS}"
+    )
+    return {str(pr["number"]): pr for pr in json.loads(prs_json)}
+
+
+async def review_all(args):
+    """Review every requested PR and return {pr_number: target_file or exception}."""
+    pr_numbers = list(args.pr_numbers)
+    listed = {}
+    if args.query:
+        with REPORT.stage("list-prs"):
+            listed = await list_prs(args.query, args.limit)
+        pr_numbers += list(listed)
+    pr_numbers = list(dict.fromkeys(pr_numbers))
+    if not pr_numbers:
+        print("No PRs to review")
+        return {}
+
+    # One toplevel lookup and one prefetch serve every PR in the run.
+    git_top_dir = await run_command("git rev-parse --show-toplevel")
+    run = ReviewRun(args, git_top_dir, batch=len(pr_numbers) > 1)
+
+    print("Prefetching PR metadata and diffs...")
+    with REPORT.stage("prefetch"):
+        run.prs = await prefetch_prs(run, pr_numbers, listed)
+
+    # Let CI cancel a run like Ctrl-C does, so claude sessions and worktrees are cleaned up.
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+
+    async def guarded(pr_number):
+        CURRENT_PR.set(pr_number)
+        try:
+            with REPORT.stage("review"):
+                return await review_pr(run, pr_number)
+        except Exception as e:
+            # Whatever goes wrong with one PR, the others still run and get a
+            # summary line; CancelledError is not an Exception and still stops all.
+            pr_logger(pr_number, run.batch)(f"Review failed: {e}")
+            return e
+
+    tasks = [asyncio.ensure_future(guarded(n)) for n in pr_numbers]
+    try:
+        results = await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        # gather has already cancelled the reviews; let each one stop claude and
+        # remove its worktree before asyncio.run cancels the leftovers again.
+        await asyncio.wait(tasks)
+        raise
+
+    if run.cache:
+        totals = run.cache.save_stats()
+        print(
+            f"Review cache: {run.cache.hits} hits, {run.cache.misses} misses this run "
+            f"({totals['hits']} hits, {totals['misses']} misses in total)"
+        )
+    return dict(zip(pr_numbers, results))
+
+
+def select_reviewers(parser, args):
+    """Resolve --reviewer-type and --reviewer-prompt into [(name, prompt template)]."""
+    reviewers = dict(REVIEWERS)
+    for spec in args.reviewer_prompt:
+        name, sep, prompt_file = spec.partition("=")
+        if not sep or not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+            parser.error(f"--reviewer-prompt expects NAME=FILE, got {spec!r}")
+        if name in REVIEWERS or name == "all":
+            parser.error(f"--reviewer-prompt cannot redefine the {name!r} reviewer")
+        try:
+            prompt = Path(prompt_file).read_text()
+            prompt.format(
+                pr_number="", level_of_thinking="", diff_instruction="", review_file=""
+            )
+        except OSError as e:
+            parser.error(f"cannot read reviewer prompt {prompt_file}: {e}")
+        except (KeyError, IndexError, ValueError) as e:
+            parser.error(f"bad placeholder in reviewer prompt {prompt_file}: {e}")
+        reviewers[name] = prompt
+
+    if args.reviewer_type == "all":
+        return list(reviewers.items())
+    if args.reviewer_type not in reviewers:
+        parser.error(
+            f"unknown --reviewer-type {args.reviewer_type!r} "
+            f"(choose from {', '.join([*reviewers, 'all'])})"
+        )
+    return [(args.reviewer_type, reviewers[args.reviewer_type])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PR Review Script")
+    parser.add_argument("pr_numbers", nargs="*", help="PR number(s) to review")
+    parser.add_argument(
+        "--query",
+        help='Also review the PRs matching this "gh pr list --search" query (e.g. "review:required")',
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=100,
+        help="Maximum number of PRs taken from --query (default: 100)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=4,
+        help="Maximum number of claude processes running at once (default: 4)",
+    )
+    worktree_mode = parser.add_mutually_exclusive_group()
+    worktree_mode.add_argument(
+        "--use-existing-worktree",
+        action="store_true",
+        help="Use existing worktree vs recreating worktree (clean one)",
+    )
+    worktree_mode.add_argument(
+        "--worktree-pool",
+        action="store_true",
+        help="Recycle warm pooled worktrees (detached at the PR head) instead of one per branch",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="Maximum number of pooled worktrees (default: --jobs)",
+    )
+    parser.add_argument(
+        "--pool-disk-budget-mb",
+        type=int,
+        default=10240,
+        help="Evict least recently used pooled worktrees above this size (default: 10240)",
+    )
+    parser.add_argument(
+        "--reviewer-type",
+        default="senior",
+        help="Type of reviewer: senior, junior, a --reviewer-prompt name, or all "
+        "to run every reviewer in parallel and combine the results. Senior is default.",
+    )
+    parser.add_argument(
+        "--reviewer-prompt",
+        action="append",
+        default=[],
+        metavar="NAME=FILE",
+        help="Add a custom reviewer whose prompt is read from FILE; it may use "
+        "{pr_number}, {level_of_thinking}, {diff_instruction} and {review_file}",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Review only the commits pushed since the last review and append to its file",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=3600,
+        help="Kill a claude session after this many seconds, 0 for no limit (default: 3600)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=int,
+        default=600,
+        help="Kill a claude session silent for this many seconds, 0 for no limit (default: 600)",
+    )
+    parser.add_argument(
+        "--cleanup-worktree",
+        action="store_true",
+        help="Remove the branch worktree after the review, like do-pr-review-cleanup.sh",
+    )
+    parser.add_argument(
+        "--prefetch-ttl",
+        type=int,
+        default=300,
+        help="Reuse prefetched PR metadata and diffs for this many seconds (default: 300)",
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=int,
+        default=200000,
+        help="Split diffs larger than this into shards reviewed in parallel, 0 to disable (default: 200000)",
+    )
+    parser.add_argument(
+        "--synthesis-model",
+        default="haiku",
+        help="Model for merging shard reviews into one (default: haiku)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run claude, ignoring and not updating the review cache",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=256,
+        help="Evict least recently used cached reviews above this size (default: 256)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="Directory within the worktree where claude should run (default: worktree root)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Directory where review file should be written (default: current directory)",
+    )
+    parser.add_argument(
+        "--report",
+        help="Write per-step and per-command timings as JSONL to this file",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write the same timings as a Chrome trace (chrome://tracing, Perfetto)",
+    )
+    parser.add_argument(
+        "--level-of-thinking",
+        choices=["think", "think hard", "think harder", "ultrathink"],
+        default="think",
+        help="Level of thinking intensity for the review (default: think)",
+    )
+
+    args = parser.parse_args()
+    if not args.pr_numbers and not args.query:
+        parser.error("give at least one PR number or --query")
+    for pr_number in args.pr_numbers:
+        # They end up in GraphQL aliases, ref names and shell commands.
+        if not re.fullmatch(r"[0-9]+", pr_number) or int(pr_number) < 1:
+            parser.error(f"PR numbers must be positive integers, got {pr_number!r}")
+    args.pr_numbers = [str(int(pr_number)) for pr_number in args.pr_numbers]
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    args.reviewers = select_reviewers(parser, args)
+
+    try:
+        results = asyncio.run(review_all(args))
+    except CommandError:
         sys.exit(1)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Interrupted, claude sessions stopped")
+        sys.exit(130)
+    finally:
+        REPORT.print_summary()
+        if args.report:
+            REPORT.write_jsonl(args.report)
+            print(f"Run report written to {args.report}")
+        if args.trace:
+            REPORT.write_chrome_trace(args.trace)
+            print(f"Chrome trace written to {args.trace}")
 
-    print(f"PR #{pr_number} review completed successfully!")
+    failed = [n for n, result in results.items() if isinstance(result, Exception)]
+    if len(results) > 1:
+        print("Summary:")
+        for pr_number, result in results.items():
+            status = (
+                f"FAILED ({result})"
+                if isinstance(result, Exception)
+                else f"OK -> {result}"
+            )
+            print(f"  PR #{pr_number}: {status}")
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":